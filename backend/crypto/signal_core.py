@@ -7,25 +7,82 @@
 #   Тут немає лічильників повідомлень та DH-ratchet.
 #   Використовується один спільний ключ AES-GCM, отриманий
 #   з X3DH/Curve25519, для шифрування/дешифрування.
+#
+#   pypy-compatible: модуль — лише glue-код, важка робота в C.
+#   Тільки стабільні точки входу cryptography / hashlib / binascii /
+#   pynacl (cffi), без numpy/numba і без власних C-розширень.
 # ============================================================
 
 import os
-import base64
-from dataclasses import dataclass
+import json
+from binascii import a2b_base64, b2a_base64
+import hashlib
+import hmac
+import functools
+import itertools
+import threading
 
 from cryptography.hazmat.primitives.asymmetric.x25519 import (
     X25519PrivateKey,
     X25519PublicKey,
 )
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 from cryptography.hazmat.primitives.serialization import (
     Encoding,
-    PrivateFormat,
     PublicFormat,
-    NoEncryption,
 )
 
+try:
+    # libsodium (PyNaCl) — опціонально, якщо нема, лишаємось на cryptography
+    from nacl import bindings as _sodium
+    from nacl.exceptions import UnavailableError as _SodiumUnavailableError
+except ImportError:
+    _sodium = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Публічний контракт модуля. Нативна реалізація (C/Rust) гарячого
+# шляху має віддавати саме ці імена з тими самими форматами пакетів,
+# щоб її можна було підставити замість цього модуля.
+__all__ = [
+    "b64e",
+    "b64d",
+    "dumps_packet",
+    "hkdf",
+    "SUITE_AES256GCM",
+    "SUITE_CHACHA20POLY1305",
+    "AEAD_SUITE",
+    "X25519_BACKEND",
+    "clear_key_cache",
+    "verify_spk_sig",
+    "generate_identity",
+    "generate_identity_raw",
+    "generate_onetime_prekeys",
+    "generate_onetime_prekeys_soa",
+    "iter_prekeys",
+    "generate_ephemeral_key",
+    "generate_ephemeral_key_b64",
+    "x3dh_sender",
+    "x3dh_sender_raw",
+    "RatchetState",
+    "session_nonce_prefixes",
+    "ratchet_encrypt",
+    "ratchet_decrypt",
+    "ratchet_encrypt_raw",
+    "ratchet_decrypt_raw",
+    "pack_packet",
+    "unpack_packet",
+    "ratchet_decrypt_batch",
+    "ratchet_encrypt_batch",
+    "ratchet_decrypt_framed",
+    "ratchet_encrypt_stream",
+    "ratchet_decrypt_stream",
+    "ratchet_decrypt_batch_raw",
+]
+
 
 # ------------------------------------------------------------
 #   Base64 helpers
@@ -33,49 +90,260 @@ from cryptography.hazmat.primitives.serialization import (
 
 def b64e(b: bytes) -> str:
     """bytes → base64 str"""
-    return base64.b64encode(b).decode("utf-8")
+    return b2a_base64(b, newline=False).decode("ascii")
 
 
 def b64d(s: str) -> bytes:
-    """base64 str → bytes"""
-    return base64.b64decode(s.encode("utf-8"))
+    """base64 str → bytes (a2b_base64 приймає str напряму)"""
+    return a2b_base64(s)
+
+
+def _json_default(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return b64e(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def dumps_packet(packet: dict) -> bytes:
+    """
+    JSON (bytes) для raw-пакета з ratchet_encrypt_raw: bytes-поля
+    кодуються в base64 прямо в серіалізаторі, без проміжного dict з str.
+    """
+    if orjson is not None:
+        return orjson.dumps(packet, default=_json_default)
+    return json.dumps(packet, default=_json_default, separators=(",", ":")).encode("utf-8")
 
 
 # ------------------------------------------------------------
 #   HKDF-подібна функція (на SHA-256)
 # ------------------------------------------------------------
 
+# info-мітки KDF — одна копія на модуль, щоб не розʼїхались між викликами
+_INFO_SIG = b"sig"
+_INFO_X3DH = b"X3DH"
+_INFO_MSG_KEY = b"msg_key_v1"
+
+_sha256 = hashlib.sha256  # без пошуку атрибута модуля на кожен KDF
+
+
 def hkdf(secret: bytes, salt: bytes = b"", info: bytes = b"", length: int = 32) -> bytes:
     """
     Дуже проста HKDF-подібна функція:
     K = SHA256(salt || secret || info)[:length]
     Для нашого випадку цього достатньо.
+
+    hashlib робить це одним викликом (SHA-NI там, де є), без
+    обʼєкта cryptography.Hash і трьох update() через FFI.
+
+    Для length > 32 K стає PRK для HKDF-Expand (RFC 5869):
+    T(i) = HMAC(PRK, T(i-1) || info || i), OKM = T(1) || T(2) || ...
+    — один ланцюжок на весь вихід, зрізи OKM незалежні між собою.
     """
-    h = hashes.Hash(hashes.SHA256())
-    h.update(salt)
-    h.update(secret)
-    h.update(info)
-    k = h.finalize()
-    return k[:length]
+    k = _sha256(b"".join((salt, secret, info))).digest()
+    if length <= 32:
+        return k[:length]
+    if length > 255 * 32:
+        raise ValueError("hkdf: length > 255 * HashLen")
+
+    # ipad/opad-блоки ключа рахуються один раз, далі лише copy()
+    keyed = hmac.new(k, digestmod=_sha256)
+    blocks = []
+    t = b""
+    for i in range(1, -(-length // 32) + 1):
+        h = keyed.copy()
+        h.update(b"".join((t, info, bytes((i,)))))
+        t = h.digest()
+        blocks.append(t)
+    return b"".join(blocks)[:length]
+
+
+# ------------------------------------------------------------
+#   AEAD backend: cryptography AESGCM або ChaCha20-Poly1305
+#   там, де нема апаратного AES
+#
+#   Розподіл по бекендах (вибір один раз при імпорті):
+#     AES + CLMUL (x86 / ARMv8-CE) → AES-256-GCM через OpenSSL
+#     інакше                        → ChaCha20-Poly1305 через OpenSSL
+#     X25519                        → libsodium, якщо є PyNaCl
+#   ChaCha20 лишається на OpenSSL: одноразові AEAD-виклики PyNaCl
+#   повільніші за кешований обʼєкт cryptography (див. нижче).
+#
+#   AESGCM-обʼєкт живе в RatchetState весь час сесії, тому на
+#   повідомлення лишається один виклик encrypt/decrypt (~0.5 мкс).
+#   Одноразові crypto_aead_aes256gcm_* з PyNaCl і Cipher/GCM-
+#   encryptor на кожен пакет — у ~10 разів повільніші.
+# ------------------------------------------------------------
+
+def _sodium_aesgcm_available() -> bool:
+    """
+    libsodium віддає AES-256-GCM лише на CPU з AES-NI / ARMv8-CE
+    (перевірка через CPUID), а старі PyNaCl взагалі не мають цих
+    bindings. Використовуємо як надійну ознаку апаратного AES.
+    """
+    if _sodium is None or not hasattr(_sodium, "crypto_aead_aes256gcm_encrypt"):
+        return False
+    try:
+        _sodium.crypto_aead_aes256gcm_encrypt(b"", None, bytes(12), bytes(32))
+    except _SodiumUnavailableError:
+        return False
+    return True
+
+
+def _cpu_has_fast_gcm() -> bool:
+    """
+    Чи є апаратний GCM: AES (x86 AES-NI / ARMv8-CE, прапорець "aes")
+    і carry-less множення для GHASH ("pclmulqdq" на x86, "pmull" на ARM)
+    у /proc/cpuinfo. Без CLMUL GHASH програмний і GCM програє ChaCha20
+    навіть з AES-NI. Якщо файлу нема (не Linux), вважаємо, що є.
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("flags", "Features")):
+                    flags = set(line.partition(":")[2].split())
+                    return "aes" in flags and ("pclmulqdq" in flags or "pmull" in flags)
+    except OSError:
+        pass
+    return True
+
+
+SUITE_AES256GCM = "aes256gcm"
+SUITE_CHACHA20POLY1305 = "chacha20poly1305"
+
+# для розшифрування пакетів, зашифрованих іншим suite
+_AEAD_BY_SUITE = {
+    SUITE_AES256GCM: AESGCM,
+    SUITE_CHACHA20POLY1305: ChaCha20Poly1305,
+}
+
+# SIGNAL_AEAD_SUITE — примусовий вибір (напр. у пісочниці, де
+# /proc/cpuinfo не відповідає реальному CPU)
+_SUITE = os.environ.get("SIGNAL_AEAD_SUITE")
+if _SUITE not in _AEAD_BY_SUITE:
+    if _sodium_aesgcm_available() or _cpu_has_fast_gcm():
+        _SUITE = SUITE_AES256GCM
+    else:
+        # без AES-NI програмний GCM у рази повільніший за ChaCha20
+        _SUITE = SUITE_CHACHA20POLY1305
+_AEAD = _AEAD_BY_SUITE[_SUITE]
+
+# suite, яким цей процес шифрує — для узгодження з peer-ом (bundle)
+AEAD_SUITE = _SUITE
+
+
+# ------------------------------------------------------------
+#   Пул ентропії (дрібні випадкові значення)
+# ------------------------------------------------------------
+# Лише для несекретних значень (nonce prefix-и); приватні ключі
+# беруться напряму з os.urandom і в модульному буфері не лишаються.
+
+_RAND_POOL_SIZE = 4096
+_rand_pool = b""
+_rand_pos = _RAND_POOL_SIZE
+_rand_lock = threading.Lock()
+
+
+def _reset_rand_pool() -> None:
+    # після fork дочірній процес не повинен ділити пул з батьком
+    global _rand_pos
+    _rand_pos = _RAND_POOL_SIZE
+
+
+os.register_at_fork(after_in_child=_reset_rand_pool)
+
+
+def _random_bytes(n: int) -> bytes:
+    """
+    n (≤ 4096) випадкових байтів з пулу os.urandom(4096): один
+    getrandom(2) на сотні дрібних запитів замість syscall на кожен.
+    """
+    global _rand_pool, _rand_pos
+    with _rand_lock:
+        pos = _rand_pos
+        if pos + n > _RAND_POOL_SIZE:
+            _rand_pool = os.urandom(_RAND_POOL_SIZE)
+            pos = 0
+        _rand_pos = pos + n
+        return _rand_pool[pos:pos + n]
+
+
+# ------------------------------------------------------------
+#   X25519 backend: libsodium crypto_scalarmult або cryptography
+# ------------------------------------------------------------
+
+# який бекенд X25519 активний — щоб у деплої було видно, чи працює libsodium
+X25519_BACKEND = "libsodium" if _sodium is not None else "cryptography"
+
+if _sodium is not None:
+    def _x25519(priv: bytes, pub: bytes) -> bytes:
+        """DH на сирих 32-байтних ключах — один C-виклик у libsodium."""
+        return _sodium.crypto_scalarmult(priv, pub)
+
+    def _x25519_many(priv: bytes, pubs) -> list[bytes]:
+        """DH одного приватного ключа з кількома публічними."""
+        return [_sodium.crypto_scalarmult(priv, pub) for pub in pubs]
+
+    def _x25519_base(priv: bytes) -> bytes:
+        """Публічний ключ з приватного — base-point множення в libsodium."""
+        return _sodium.crypto_scalarmult_base(priv)
+else:
+    # _x25519 у X3DH — це dh1 на identity-ключі відправника, той самий
+    # для всіх його сесій: EVP_PKEY парсимо раз. Ефемерні ключі
+    # (_x25519_many) сюди не йдуть — вони одноразові і лише витісняли б
+    # identity. Кеш чиститься через clear_key_cache() (ZeroTrace wipe).
+    @functools.lru_cache(maxsize=128)
+    def _load_priv(priv: bytes) -> X25519PrivateKey:
+        return X25519PrivateKey.from_private_bytes(priv)
+
+    @functools.lru_cache(maxsize=128)
+    def _load_pub(pub: bytes) -> X25519PublicKey:
+        return X25519PublicKey.from_public_bytes(pub)
+
+    def _x25519(priv: bytes, pub: bytes) -> bytes:
+        """DH на сирих 32-байтних ключах через cryptography (EVP_PKEY)."""
+        return _load_priv(priv).exchange(_load_pub(pub))
+
+    def _x25519_many(priv: bytes, pubs) -> list[bytes]:
+        """DH одного приватного ключа з кількома публічними; EVP_PKEY — один."""
+        key = X25519PrivateKey.from_private_bytes(priv)
+        return [key.exchange(X25519PublicKey.from_public_bytes(pub)) for pub in pubs]
+
+    def _x25519_base(priv: bytes) -> bytes:
+        """Публічний ключ з приватного через cryptography."""
+        return _pub_bytes(X25519PrivateKey.from_private_bytes(priv).public_key())
+
+
+def clear_key_cache() -> None:
+    """Скидає кеш розпарсених X25519-ключів (є лише без libsodium)."""
+    if _sodium is None:
+        _load_priv.cache_clear()
+        _load_pub.cache_clear()
 
 
 # ============================================================
 #   Identity + PreKeys (base64 формат для бекенду)
 # ============================================================
 
-def _priv_bytes(priv: X25519PrivateKey) -> bytes:
-    return priv.private_bytes(
-        encoding=Encoding.Raw,
-        format=PrivateFormat.Raw,
-        encryption_algorithm=NoEncryption(),
-    )
+# enum-и — один раз на модуль, у виклик ідуть позиційно
+_ENC_RAW = Encoding.Raw
+_FMT_RAW_PUB = PublicFormat.Raw
 
 
 def _pub_bytes(pub: X25519PublicKey) -> bytes:
-    return pub.public_bytes(
-        encoding=Encoding.Raw,
-        format=PublicFormat.Raw,
-    )
+    return pub.public_bytes(_ENC_RAW, _FMT_RAW_PUB)
+
+
+def _spk_sig(identity_priv: bytes, spk_pub: bytes) -> bytes:
+    # Псевдо-підпис SPK: HKDF(spk_pub, salt=identity_priv)
+    return hkdf(spk_pub, salt=identity_priv, info=_INFO_SIG, length=32)
+
+
+def verify_spk_sig(identity_priv: bytes, spk_pub: bytes, sig: bytes) -> bool:
+    """
+    Перевіряє псевдо-підпис SPK (сирі bytes) за сталий час.
+    Це канонічна перевірка — не порівнюйте підписи через ==.
+    """
+    return hmac.compare_digest(_spk_sig(identity_priv, spk_pub), sig)
 
 
 def generate_identity() -> dict:
@@ -88,24 +356,32 @@ def generate_identity() -> dict:
       - SPK (signed prekey)
     Підпис SPK робимо псевдо-підписом через HKDF.
     """
-    identity_priv = X25519PrivateKey.generate()
-    signed_prekey_priv = X25519PrivateKey.generate()
+    return {k + "_b64": b64e(v) for k, v in generate_identity_raw().items()}
 
-    identity_priv_bytes = _priv_bytes(identity_priv)
-    identity_pub_bytes = _pub_bytes(identity_priv.public_key())
 
-    spk_priv_bytes = _priv_bytes(signed_prekey_priv)
-    spk_pub_bytes = _pub_bytes(signed_prekey_priv.public_key())
+def generate_identity_raw() -> dict:
+    """
+    Як generate_identity, але сирі 32-байтні bytes без base64:
+    identity_priv, identity_pub, signed_prekey_priv, signed_prekey_pub,
+    signed_prekey_sig.
+    """
+    # Обидва секрети — одним getrandom(2), повз пул; clamp (RFC 7748)
+    # робить сам X25519 при множенні.
+    buf = os.urandom(64)
+    identity_priv_bytes = buf[:32]
+    spk_priv_bytes = buf[32:]
 
-    # Псевдо-підпис SPK: HKDF(spk_pub, salt=identity_priv)
-    sig = hkdf(spk_pub_bytes, salt=identity_priv_bytes, info=b"sig", length=32)
+    identity_pub_bytes = _x25519_base(identity_priv_bytes)
+    spk_pub_bytes = _x25519_base(spk_priv_bytes)
+
+    sig = _spk_sig(identity_priv_bytes, spk_pub_bytes)
 
     return {
-        "identity_priv_b64": b64e(identity_priv_bytes),
-        "identity_pub_b64": b64e(identity_pub_bytes),
-        "signed_prekey_priv_b64": b64e(spk_priv_bytes),
-        "signed_prekey_pub_b64": b64e(spk_pub_bytes),
-        "signed_prekey_sig_b64": b64e(sig),
+        "identity_priv": identity_priv_bytes,
+        "identity_pub": identity_pub_bytes,
+        "signed_prekey_priv": spk_priv_bytes,
+        "signed_prekey_pub": spk_pub_bytes,
+        "signed_prekey_sig": sig,
     }
 
 
@@ -117,19 +393,53 @@ def generate_onetime_prekeys(n: int = 20) -> list[dict]:
         "priv_b64": ...,
         "pub_b64": ...
     }
+
+    Це обгортка над generate_onetime_prekeys_soa для API,
+    яке чекає list[dict].
     """
-    prekeys: list[dict] = []
-    for _ in range(n):
-        priv = X25519PrivateKey.generate()
-        priv_bytes = _priv_bytes(priv)
-        pub_bytes = _pub_bytes(priv.public_key())
-        prekeys.append(
-            {
-                "priv_b64": b64e(priv_bytes),
-                "pub_b64": b64e(pub_bytes),
-            }
-        )
-    return prekeys
+    priv_blob, pub_blob = generate_onetime_prekeys_soa(n)
+    return [
+        {"priv_b64": b64e(priv), "pub_b64": b64e(pub)}
+        for priv, pub in iter_prekeys(priv_blob, pub_blob)
+    ]
+
+
+def generate_onetime_prekeys_soa(n: int = 20) -> tuple[bytes, bytes]:
+    """
+    Генерує n одноразових prekey у вигляді двох суцільних буферів
+    (priv_blob, pub_blob) по 32 * n байт; i-й ключ — зріз [32i : 32i + 32].
+
+    Ентропію беремо одним os.urandom(32 * n) замість n окремих
+    X25519PrivateKey.generate().
+    """
+    priv_blob = os.urandom(32 * n)
+    pub_blob = b"".join(
+        _x25519_base(priv_blob[i:i + 32]) for i in range(0, 32 * n, 32)
+    )
+    return priv_blob, pub_blob
+
+
+def iter_prekeys(priv_blob: bytes, pub_blob: bytes):
+    """
+    Пари (priv, pub) з SoA-буферів як 32-байтні memoryview-зрізи,
+    без копіювання.
+    """
+    priv_view = memoryview(priv_blob)
+    pub_view = memoryview(pub_blob)
+    for i in range(0, len(priv_blob), 32):
+        yield priv_view[i:i + 32], pub_view[i:i + 32]
+
+
+def generate_ephemeral_key() -> bytes:
+    """
+    Генерує ефемерний (ephemeral) секретний ключ — сирі 32 байти
+    (для x3dh_sender_raw).
+
+    Публічна половина тут не потрібна, тож "генерація" — це лише
+    32 байти з os.urandom, без Curve25519-множення; фоновий пул
+    готових ключів нічого б не сховав. Секрет — не з _random_bytes.
+    """
+    return os.urandom(32)
 
 
 def generate_ephemeral_key_b64() -> str:
@@ -139,8 +449,7 @@ def generate_ephemeral_key_b64() -> str:
     У спрощеній схемі бекенд може це не використовувати,
     але функцію лишаємо для сумісності з попереднім кодом.
     """
-    priv = X25519PrivateKey.generate()
-    return b64e(_priv_bytes(priv))
+    return b64e(generate_ephemeral_key())
 
 
 # ============================================================
@@ -148,6 +457,12 @@ def generate_ephemeral_key_b64() -> str:
 #   (тут використовується тільки на бекенді для тестів або якщо ти захочеш)
 # ============================================================
 
+def _bundle_pub(bundle: dict, name: str) -> bytes:
+    """Ключ з bundle: сирі bytes під name або base64 під name + "_b64"."""
+    raw = bundle.get(name)
+    return raw if raw is not None else b64d(bundle[name + "_b64"])
+
+
 def x3dh_sender(
     identity_priv_b64: str,
     eph_priv_b64: str,
@@ -164,32 +479,51 @@ def x3dh_sender(
         "signed_prekey_pub_b64": ...,
         "signed_prekey_sig_b64": ...,
     }
+    (або "identity_pub" / "signed_prekey_pub" сирими bytes — тоді
+    base64 не декодується)
     onetime_prekey_pub_b64 — опціональний one-time prekey (pub, base64)
 
     Повертає master_secret (bytes), який далі можна прогнати через HKDF.
     """
-
-    IKr_pub = X25519PublicKey.from_public_bytes(
-        b64d(recv_bundle["identity_pub_b64"])
-    )
-    SPKr_pub = X25519PublicKey.from_public_bytes(
-        b64d(recv_bundle["signed_prekey_pub_b64"])
+    return x3dh_sender_raw(
+        b64d(identity_priv_b64),
+        b64d(eph_priv_b64),
+        _bundle_pub(recv_bundle, "identity_pub"),
+        _bundle_pub(recv_bundle, "signed_prekey_pub"),
+        b64d(onetime_prekey_pub_b64) if onetime_prekey_pub_b64 else None,
     )
 
-    IKs_priv = X25519PrivateKey.from_private_bytes(b64d(identity_priv_b64))
-    EKs_priv = X25519PrivateKey.from_private_bytes(b64d(eph_priv_b64))
-
-    # X3DH компоненти (спрощено):
-    dh1 = IKs_priv.exchange(SPKr_pub)
-    dh2 = EKs_priv.exchange(IKr_pub)
-    dh3 = EKs_priv.exchange(SPKr_pub)
-    dh4 = b""
-
-    if onetime_prekey_pub_b64:
-        OPKr_pub = X25519PublicKey.from_public_bytes(b64d(onetime_prekey_pub_b64))
-        dh4 = EKs_priv.exchange(OPKr_pub)
 
-    master = hkdf(dh1 + dh2 + dh3 + dh4, info=b"X3DH", length=32)
+def x3dh_sender_raw(
+    identity_priv: bytes,
+    eph_priv: bytes,
+    identity_pub: bytes,
+    signed_prekey_pub: bytes,
+    onetime_prekey_pub: bytes | None = None,
+) -> bytes:
+    """
+    Те саме, що x3dh_sender, але всі ключі — сирі 32-байтні bytes.
+    """
+    IKr_pub = identity_pub
+    SPKr_pub = signed_prekey_pub
+
+    IKs_priv = identity_priv
+    EKs_priv = eph_priv
+
+    # X3DH компоненти (спрощено); DH2..DH4 — один і той самий EK_s.
+    # Послідовно навмисно: ~50 мкс на DH, а ThreadPoolExecutor на три
+    # DH виходить повільніше (~210 проти ~160 мкс) через диспетчеризацію.
+    dh1 = _x25519(IKs_priv, SPKr_pub)
+
+    if onetime_prekey_pub:
+        OPKr_pub = onetime_prekey_pub
+        dh2, dh3, dh4 = _x25519_many(EKs_priv, (IKr_pub, SPKr_pub, OPKr_pub))
+    else:
+        dh2, dh3 = _x25519_many(EKs_priv, (IKr_pub, SPKr_pub))
+        dh4 = b""
+
+    # одна алокація на 96/128 байт замість проміжних bytes від "+"
+    master = hkdf(b"".join((dh1, dh2, dh3, dh4)), info=_INFO_X3DH, length=32)
     return master
 
 
@@ -197,7 +531,6 @@ def x3dh_sender(
 #   Спрощений "RatchetState" + AES-GCM
 # ============================================================
 
-@dataclass
 class RatchetState:
     """
     Спрощений стан "ratchet" для бекенду.
@@ -210,59 +543,405 @@ class RatchetState:
     Це простіше, стабільніше і не розʼїжджається,
     тому зникає cryptography.exceptions.InvalidTag через
     різні лічильники.
+
+    chain_key_send / chain_key_recv — опціональні, шифрування
+    їх не використовує.
+    nonce_prefix — 4 випадкові байти сесії; nonce = prefix || лічильник
+    (8 байт, big-endian), тож на повідомлення не потрібен RNG. Ключ
+    унікальний для сесії, лічильник не повторюється — nonce теж.
+    msg_key — AEAD-ключ, HKDF(root_key) рахується один раз при створенні.
+    _cached_key / _cached_aead — root_key, з якого виведено msg_key, і
+    AEAD-обʼєкт, зібраний теж при створенні: key schedule — раз на сесію.
+    _suite_aeads — те саме для пакетів в іншому suite, ліниво.
+
+    __slots__ замість dataclass: менший обʼєкт і швидший доступ
+    до атрибутів на кожному повідомленні.
+    """
+    __slots__ = (
+        "root_key",
+        "chain_key_send",
+        "chain_key_recv",
+        "nonce_prefix",
+        "msg_key",
+        "_send_counter",
+        "_cached_key",
+        "_cached_aead",
+        "_suite_aeads",
+    )
+
+    def __init__(
+        self,
+        root_key: bytes,
+        chain_key_send: bytes | None = None,
+        chain_key_recv: bytes | None = None,
+        nonce_prefix: bytes | None = None,
+    ):
+        self.root_key = root_key
+        self.chain_key_send = chain_key_send
+        self.chain_key_recv = chain_key_recv
+        self.nonce_prefix = nonce_prefix if nonce_prefix is not None else _random_bytes(4)
+        # itertools.count: next() атомарний під GIL, тож два потоки
+        # threadpool-а не отримають однаковий nonce
+        self._send_counter = itertools.count()
+        self.msg_key = _derive_msg_key(root_key)
+        self._cached_key = root_key
+        # key schedule AEAD — теж один раз тут, а не на першому повідомленні
+        self._cached_aead = _AEAD(self.msg_key)
+        self._suite_aeads = {}  # AEAD-и інших suite (пакети від peer-а з іншим CPU)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RatchetState":
+        """Сумісність зі старим форматом стану (dict полів)."""
+        return cls(
+            root_key=data["root_key"],
+            chain_key_send=data.get("chain_key_send"),
+            chain_key_recv=data.get("chain_key_recv"),
+            nonce_prefix=data.get("nonce_prefix"),
+        )
+
+
+def session_nonce_prefixes() -> tuple[bytes, bytes]:
+    """
+    Префікси nonce для двох напрямків однієї сесії (A→B, B→A).
+
+    Обидва напрямки шифрують тим самим ключем, тому префікси
+    відрізняються старшим бітом — лічильники ніколи не дадуть
+    однаковий nonce.
     """
-    root_key: bytes
+    p = _random_bytes(4)
+    return bytes((p[0] & 0x7F,)) + p[1:], bytes((p[0] | 0x80,)) + p[1:]
 
 
 def _derive_msg_key(root_key: bytes) -> bytes:
     """
     Отримуємо 32-байтний AES-ключ з root_key.
-    Для простоти info = b"msg_key_v1".
+    Для простоти info = _INFO_MSG_KEY (b"msg_key_v1").
+    """
+    return hkdf(root_key, info=_INFO_MSG_KEY, length=32)
+
+
+def _get_aead(state: RatchetState):
+    """
+    Повертає AEAD сесії (зібраний у RatchetState.__init__). Якщо root_key
+    замінили, msg_key і AEAD виводяться заново.
+    """
+    if state._cached_key is not state.root_key:
+        state.msg_key = _derive_msg_key(state.root_key)
+        state._cached_key = state.root_key
+        state._cached_aead = None
+        state._suite_aeads = {}
+    aead = state._cached_aead
+    if aead is None:
+        aead = state._cached_aead = _AEAD(state.msg_key)
+    return aead
+
+
+def _seal(state: RatchetState, data: bytes) -> tuple[bytes, bytes]:
+    """
+    Один крок шифрування: KDF (кешований) + nonce + AEAD.
+    Повертає (nonce, ct) сирими bytes — base64 лишається обгортці.
+    """
+    nonce = _next_nonce(state)
+    return nonce, _get_aead(state).encrypt(nonce, data, None)
+
+
+def _next_nonce(state: RatchetState) -> bytes:
+    # to_bytes(8) підніме OverflowError після 2^64 повідомлень
+    return state.nonce_prefix + next(state._send_counter).to_bytes(8, "big")
+
+
+def _open(state: RatchetState, nonce: bytes, ct: bytes, suite: str = _SUITE) -> bytes:
+    """Зворотний до _seal крок; InvalidTag, якщо ключ/пакет не той."""
+    return _suite_aead(state, suite).decrypt(nonce, ct, None)
+
+
+def _suite_aead(state: RatchetState, suite: str):
+    """AEAD сесії для suite пакета; ValueError для невідомого suite."""
+    aead = _get_aead(state)  # ще й актуалізує msg_key, якщо root_key змінився
+    if suite == _SUITE:
+        return aead
+
+    aead = state._suite_aeads.get(suite)
+    if aead is None:
+        aead_cls = _AEAD_BY_SUITE.get(suite)
+        if aead_cls is None:
+            raise ValueError(f"unknown cipher suite: {suite}")
+        # той самий msg_key — key schedule іншого suite теж раз на сесію
+        aead = state._suite_aeads[suite] = aead_cls(state.msg_key)
+    return aead
+
+
+def ratchet_encrypt_raw(state: RatchetState, data: bytes) -> dict:
+    """
+    Як ratchet_encrypt, але без base64: для бінарних транспортів
+    і внутрішніх переходів у межах процесу.
+
+    Повертає:
+    {
+        "suite": ...,
+        "nonce": bytes,
+        "ct": bytes
+    }
+    """
+    nonce, ct = _seal(state, data)
+    return {"suite": _SUITE, "nonce": nonce, "ct": ct}
+
+
+def ratchet_decrypt_raw(state: RatchetState, packet: dict) -> bytes:
+    """
+    Дешифрує пакет з ratchet_encrypt_raw, повертає plaintext bytes.
+    """
+    return _open(
+        state, packet["nonce"], packet["ct"], packet.get("suite", SUITE_AES256GCM)
+    )
+
+
+# бінарний формат raw-пакета: [suite: 1 байт][nonce: 12 байт][ct || tag]
+_SUITE_CODE = {SUITE_AES256GCM: 1, SUITE_CHACHA20POLY1305: 2}
+_CODE_SUITE = {code: suite for suite, code in _SUITE_CODE.items()}
+_NONCE_LEN = 12
+
+
+def pack_packet(packet: dict) -> bytes:
+    """
+    Пакет з ratchet_encrypt_raw → bytes для бінарних транспортів
+    (send_bytes, файли): без base64 і без JSON, +13 байт до ct.
     """
-    return hkdf(root_key, info=b"msg_key_v1", length=32)
+    return b"".join(
+        (bytes((_SUITE_CODE[packet["suite"]],)), packet["nonce"], packet["ct"])
+    )
+
+
+def unpack_packet(data: bytes) -> dict:
+    """Зворотний до pack_packet: dict, який приймає ratchet_decrypt_raw."""
+    suite = _CODE_SUITE.get(data[0]) if data else None
+    if suite is None or len(data) < 1 + _NONCE_LEN:
+        raise ValueError("malformed packet")
+    return {
+        "suite": suite,
+        "nonce": data[1:1 + _NONCE_LEN],
+        "ct": data[1 + _NONCE_LEN:],
+    }
 
 
 def ratchet_encrypt(state: RatchetState, plaintext: str) -> dict:
     """
     Шифрує повідомлення, використовуючи AES-256-GCM з ключа,
-    отриманого з state.root_key.
+    отриманого з state.root_key (кешований AESGCM сесії;
+    на CPU без AES-NI — ChaCha20-Poly1305).
 
     Повертає:
     {
+        "suite": "aes256gcm" | "chacha20poly1305",
         "nonce_b64": ...,
         "ct_b64": ...
     }
 
     Бекенд може зберігати цей пакет як є, не торкаючись plaintext.
     """
-    key = _derive_msg_key(state.root_key)
-    aes = AESGCM(key)
-
-    nonce = os.urandom(12)
-    ct = aes.encrypt(nonce, plaintext.encode("utf-8"), None)
+    nonce, ct = _seal(state, plaintext.encode("utf-8"))
 
     return {
+        "suite": _SUITE,
         "nonce_b64": b64e(nonce),
         "ct_b64": b64e(ct),
     }
 
 
-def ratchet_decrypt(state: RatchetState, packet: dict) -> tuple[str, RatchetState]:
+def ratchet_decrypt(state: RatchetState, packet: dict) -> str:
     """
-    Дешифрує пакет, зашифрований ratchet_encrypt.
+    Дешифрує пакет, зашифрований ratchet_encrypt, і повертає plaintext.
 
     Якщо ключ не підходить (невірна сесія/маніпуляція),
-    AESGCM підніме InvalidTag.
+    AEAD підніме InvalidTag. Пакет без "suite" — це AES-256-GCM.
+    state не змінюється і не повертається — викликач і так його тримає.
+    """
+    return _open(
+        state,
+        b64d(packet["nonce_b64"]),
+        b64d(packet["ct_b64"]),
+        packet.get("suite", SUITE_AES256GCM),
+    ).decode("utf-8")
+
+
+def ratchet_encrypt_batch(state: RatchetState, plaintexts: list[str]) -> dict:
+    """
+    Шифрує кілька повідомлень одним пакетом: кожне — [довжина: 4 байти
+    BE][utf-8], усе разом — один AEAD-виклик з одним nonce і тегом.
+    OpenSSL отримує суцільний буфер і паралелить AES-блоки/GHASH,
+    замість 1-2 блоків на виклик для коротких чат-повідомлень.
+
+    Формат — як у ratchet_encrypt, плюс "frames": кількість повідомлень.
+    Розшифровується ratchet_decrypt_framed.
+    """
+    parts = []
+    for text in plaintexts:
+        data = text.encode("utf-8")
+        parts.append(len(data).to_bytes(4, "big"))
+        parts.append(data)
+    nonce, ct = _seal(state, b"".join(parts))
+
+    return {
+        "suite": _SUITE,
+        "nonce_b64": b64e(nonce),
+        "ct_b64": b64e(ct),
+        "frames": len(plaintexts),
+    }
+
+
+def ratchet_decrypt_framed(state: RatchetState, packet: dict) -> list[str]:
+    """
+    Дешифрує пакет з ratchet_encrypt_batch, повертає список plaintext-ів.
+    InvalidTag — як у ratchet_decrypt; ValueError, якщо рамки не сходяться.
+    """
+    data = memoryview(
+        _open(
+            state,
+            b64d(packet["nonce_b64"]),
+            b64d(packet["ct_b64"]),
+            packet.get("suite", SUITE_AES256GCM),
+        )
+    )
+    texts = []
+    pos = 0
+    while pos < len(data):
+        end = pos + 4 + int.from_bytes(data[pos:pos + 4], "big")
+        if end > len(data):
+            raise ValueError("malformed batch frame")
+        texts.append(str(data[pos + 4:end], "utf-8"))
+        pos = end
+    if len(texts) != packet.get("frames", len(texts)):
+        raise ValueError("batch frame count mismatch")
+    return texts
+
+
+# ------------------------------------------------------------
+#   Потокове шифрування (файли / великі payload-и)
+# ------------------------------------------------------------
+
+_STREAM_CHUNK = 32 * 1024
+_STREAM_MAX_FRAME = 1024 * 1024 + 16  # ліміт кадру при розборі: ct + tag
+_AEAD_TAG_LEN = 16
+
+
+def _stream_aad(stream_id: bytes, index: int, final: bool) -> bytes:
+    # привʼязує кадр до потоку, його позиції і того, чи він останній:
+    # переставити, викинути чи обрізати кадри непомітно не вийде
+    return b"".join((stream_id, index.to_bytes(8, "big"), b"\x01" if final else b"\x00"))
+
+
+def _read_exact(reader, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        chunk = reader.read(n - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return buf
+
 
-    Повертає (plaintext, state).
-    Тут state не змінюється, але повертаємо його для
-    сумісності з попереднім API.
+def ratchet_encrypt_stream(state: RatchetState, reader, writer, chunk_size: int = _STREAM_CHUNK) -> dict:
     """
-    key = _derive_msg_key(state.root_key)
-    aes = AESGCM(key)
+    Шифрує потік reader → writer кадрами по chunk_size (32 KiB) на AEAD
+    сесії (той самий suite, що й у звичайних повідомленнях і в bundle):
+    пам'ять не росте з розміром, а кожен кадр має власний тег.
+
+    Кадр: [nonce: 12][довжина ct: 4 байти BE][ct || tag]. Nonce кожного
+    кадру — з лічильника сесії, AAD — ідентифікатор потоку (nonce
+    першого кадру), номер кадру і ознака останнього.
+    Повертає {"suite": ..., "nonce": ідентифікатор потоку}.
+    """
+    if not 0 < chunk_size <= _STREAM_MAX_FRAME - _AEAD_TAG_LEN:
+        raise ValueError("chunk_size out of range")
+    aead = _get_aead(state)
+    stream_id = None
+    index = 0
+    chunk = reader.read(chunk_size)
+    while True:
+        # читаємо наперед, щоб знати, чи поточний кадр останній
+        ahead = reader.read(chunk_size) if chunk else b""
+        final = not ahead
+        nonce = _next_nonce(state)
+        if stream_id is None:
+            stream_id = nonce
+        ct = aead.encrypt(nonce, chunk, _stream_aad(stream_id, index, final))
+        writer.write(b"".join((nonce, len(ct).to_bytes(4, "big"), ct)))
+        if final:
+            return {"suite": _SUITE, "nonce": stream_id}
+        chunk = ahead
+        index += 1
+
+
+def ratchet_decrypt_stream(state: RatchetState, nonce: bytes, reader, writer, suite: str = SUITE_AES256GCM) -> None:
+    """
+    Зворотний до ratchet_encrypt_stream; nonce і suite — з його результату.
 
-    nonce = b64d(packet["nonce_b64"])
-    ct = b64d(packet["ct_b64"])
+    Кожен кадр перевіряється до запису у writer, тож неавтентифікований
+    plaintext назовні не виходить. InvalidTag — підмінений/переставлений
+    кадр; ValueError — обрізаний потік або битий кадр. Записане до
+    помилки — автентичний початок потоку, але не весь потік.
+    """
+    aead = _suite_aead(state, suite)
+    index = 0
+    ahead = b""  # байт, прочитаний наперед для перевірки кінця потоку
+    while True:
+        header = ahead + _read_exact(reader, 16 - len(ahead))
+        if len(header) < 16:
+            raise ValueError("truncated stream")
+        frame_nonce = header[:12]
+        ct_len = int.from_bytes(header[12:], "big")
+        if ct_len < _AEAD_TAG_LEN or ct_len > _STREAM_MAX_FRAME:
+            raise ValueError("malformed stream frame")
+        if index == 0 and frame_nonce != nonce:
+            raise ValueError("stream id mismatch")
+        ct = _read_exact(reader, ct_len)
+        if len(ct) < ct_len:
+            raise ValueError("truncated stream")
+
+        # останній кадр — той, після якого дані закінчились; якщо хтось
+        # відрізав хвіст, тег із final=False на новому "останньому" не зійдеться
+        ahead = reader.read(1)
+        final = not ahead
+        writer.write(aead.decrypt(frame_nonce, ct, _stream_aad(nonce, index, final)))
+        if final:
+            return
+        index += 1
+
+
+def _open_batch(state: RatchetState, items) -> list[bytes]:
+    # items: (nonce, ct, suite); AEAD сесії дістається один раз
+    aead = _get_aead(state)
+    return [
+        aead.decrypt(nonce, ct, None) if suite == _SUITE else _open(state, nonce, ct, suite)
+        for nonce, ct, suite in items
+    ]
+
+
+def ratchet_decrypt_batch(state: RatchetState, packets: list[dict]) -> list[str]:
+    """
+    Дешифрує кілька пакетів однієї сесії (напр. вся черга з poll).
+    AEAD сесії дістається один раз на весь батч, а не на кожен пакет.
 
-    plaintext = aes.decrypt(nonce, ct, None).decode("utf-8")
-    return plaintext, state
\ No newline at end of file
+    Повертає plaintext-и в тому ж порядку; InvalidTag — як у ratchet_decrypt.
+    """
+    return [
+        data.decode("utf-8")
+        for data in _open_batch(
+            state,
+            (
+                (b64d(p["nonce_b64"]), b64d(p["ct_b64"]), p.get("suite", SUITE_AES256GCM))
+                for p in packets
+            ),
+        )
+    ]
+
+
+def ratchet_decrypt_batch_raw(state: RatchetState, packets: list[dict]) -> list[bytes]:
+    """
+    Як ratchet_decrypt_batch, але для пакетів з ratchet_encrypt_raw;
+    повертає plaintext bytes.
+    """
+    return _open_batch(
+        state,
+        ((p["nonce"], p["ct"], p.get("suite", SUITE_AES256GCM)) for p in packets),
+    )
@@ -1,71 +1,192 @@
 # ============================================================
-#   SIGNAL MESSENGER v7 — BACKEND (SYNCED WITH signal_core v6)
+#   SIGNAL MESSENGER v7 — BACKEND (SYNCED WITH signal_core v7)
 #   FastAPI + X3DH + Symmetric Double Ratchet + ZeroTrace RAM
 #   Secure Messaging + WebRTC Signaling
 # ============================================================
 
-import uuid
-import json
-from typing import Dict, List, Tuple
-
+import os
+import hmac
+import asyncio
+import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+import msgspec
+import orjson
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from cryptography.exceptions import InvalidTag
+from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 
 from crypto.signal_core import (
-    generate_identity,
+    AEAD_SUITE,
+    b64d,
+    b64e,
+    clear_key_cache,
+    generate_identity_raw,
     generate_onetime_prekeys,
-    generate_ephemeral_key_b64,
-    x3dh_sender,
+    generate_ephemeral_key,
+    x3dh_sender_raw,
     RatchetState,
-    ratchet_encrypt,
+    ratchet_encrypt_raw,
     ratchet_decrypt,
+    ratchet_decrypt_batch_raw,
+    ratchet_decrypt_raw,
+    session_nonce_prefixes,
 )
 
 # ============================================================
 #   APP + CORS
 # ============================================================
 
-app = FastAPI(title="Signal v7 Backend")
+class ORJSONResponse(JSONResponse):
+    """JSONResponse, серіалізований orjson (C) замість stdlib json."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],          # в проді краще вказати конкретні домени
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+
+# allow_origins=["*"] без credentials (фронтенди не шлють cookies) —
+# заголовки завжди ті самі, тож збираємо їх один раз
+_CORS_HEADERS = ((b"access-control-allow-origin", b"*"),)  # в проді краще конкретні домени
+_CORS_PREFLIGHT_HEADERS = _CORS_HEADERS + (
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-max-age", b"600"),
+    (b"content-length", b"0"),
 )
 
 
-@app.options("/{path:path}")
-async def preflight_handler(path: str):
+class StaticCORS:
     """
-    Глобальний handler для OPTIONS (CORS preflight),
-    щоб браузер не сипався на /message/poll тощо.
+    ASGI CORS з незмінними заголовками замість CORSMiddleware:
+    preflight відповідаємо одразу, до решти відповідей дописуємо
+    готовий кортеж заголовків.
     """
-    return JSONResponse(
-        status_code=200,
-        content={"ok": True},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        },
-    )
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if scope["method"] == "OPTIONS" and any(
+            name == b"access-control-request-method" for name, _ in scope["headers"]
+        ):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": _CORS_PREFLIGHT_HEADERS,
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = (*message.get("headers", ()), *_CORS_HEADERS)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app = FastAPI(title="Signal v7 Backend", default_response_class=ORJSONResponse)
+app.add_middleware(StaticCORS)
+
 
 # ============================================================
 #   ZERO-TRACE STORAGE (RAM only)
 # ============================================================
 
 USERS: Dict[str, dict] = {}
-PREKEYS: Dict[str, List[dict]] = {}
-SESSIONS: Dict[Tuple[str, str], RatchetState] = {}
-INBOX: Dict[str, List[dict]] = {}
+# SoA: "pubs" — готовий список pub_b64 (віддається в /bundle як є),
+# "privs" — pub_b64 → priv_b64; pop по ключу тримає пари узгодженими.
+# Prekey-ї видаємо з кінця списку: list.pop() — O(1) без memmove,
+# а list (на відміну від deque) orjson серіалізує напряму
+PREKEYS: Dict[str, dict] = {}
+# кожен user_id отримує цілий slot; SESSIONS ключуємо одним int
+# (min_slot << 32) | max_slot — хеш int-а тривіальний,
+# без кортежу і хешування двох рядків на кожне повідомлення
+USER_SLOT: Dict[str, int] = {}
+_NEXT_SLOT = itertools.count()  # next() атомарний — безпечно з threadpool
+
+
+class SessionPair:
+    """
+    Одна сесія на пару юзерів: стан для кожного напрямку.
+    a — юзер з меншим slot-ом. Обидва стани ділять один root_key.
+    """
+    __slots__ = ("a_to_b", "b_to_a")
+
+    def __init__(self, a_to_b: RatchetState, b_to_a: RatchetState):
+        self.a_to_b = a_to_b
+        self.b_to_a = b_to_a
+
+
+SESSIONS: Dict[int, SessionPair] = {}
+MAX_PENDING = 4096  # ліміт черги на юзера: найстаріші витісняються
+INBOX: Dict[str, Deque[dict]] = {}
 CALL_CONNECTIONS: Dict[str, WebSocket] = {}
+CALL_SLOTS: Dict[int, WebSocket] = {}  # ті ж сокети, але по USER_SLOT
+
+# адресат сигналу без повного розбору кадру: фронтенди шлють
+# JSON.stringify({type, from, to, data}) — без пробілів, і "to" стоїть
+# до важкого SDP/ICE у data, тож дивимось лише на заголовок кадру
+_SIGNAL_TO = '"to":"'
+_SIGNAL_HEAD = 256
+
+
+class SignalMsg(msgspec.Struct):
+    # з кадру потрібен лише адресат; решта полів (SDP/ICE) пропускається
+    # декодером без побудови dict-ів
+    to: str | None = None
+
+
+_decode_signal = msgspec.json.Decoder(SignalMsg).decode
+
+
+def _decode_signal_target(raw) -> str | None:
+    """Адресат з JSON-кадру (str або bytes); None — кадр битий."""
+    try:
+        return _decode_signal(raw).to
+    except msgspec.DecodeError:
+        return None
+
+
+def _signal_target(raw: str) -> str | None:
+    i = raw.find(_SIGNAL_TO, 0, _SIGNAL_HEAD)
+    if i >= 0:
+        i += len(_SIGNAL_TO)
+        j = raw.find('"', i)
+        if j > i and "\\" not in raw[i:j]:
+            return raw[i:j]
+    # escape-и в id або нестандартний кадр — чесний JSON-розбір
+    return _decode_signal_target(raw)
+
 
 ZERO_TRACE_SECRET = "SET_YOUR_SECRET"  # поміняй на свій
+# порівнюємо дайджести фіксованої довжини за сталий час — без витоку
+# довжини/префікса секрету через таймінг
+_WIPE_DIGEST = hashlib.sha256(ZERO_TRACE_SECRET.encode("utf-8")).digest()
+
+
+def _session_state(sender_id: str, receiver_id: str) -> RatchetState | None:
+    """Стан сесії для напрямку sender → receiver (None, якщо сесії нема)."""
+    a = USER_SLOT.get(sender_id)
+    b = USER_SLOT.get(receiver_id)
+    if a is None or b is None:
+        return None
+    if a <= b:
+        pair = SESSIONS.get((a << 32) | b)
+        return pair.a_to_b if pair is not None else None
+    pair = SESSIONS.get((b << 32) | a)
+    return pair.b_to_a if pair is not None else None
+
 
 # ============================================================
 #   Pydantic Models
@@ -81,12 +202,39 @@ class InitiateSessionPayload(BaseModel):
     receiver_id: str
 
 
-class MessageSendPayload(BaseModel):
+class MessageSendPayload(msgspec.Struct):
+    # найгарячіший ендпоінт: msgspec декодує і валідує тіло за один
+    # C-прохід, без Pydantic-моделі на кожне повідомлення
     sender_id: str
     receiver_id: str
     text: str
 
 
+_decode_message_send = msgspec.json.Decoder(MessageSendPayload).decode
+
+# тіло читаємо самі, тож FastAPI не бачить моделі — схему для
+# /openapi.json генерує msgspec з того ж Struct
+_MESSAGE_SEND_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": msgspec.json.schema_components([MessageSendPayload])[1][
+                    "MessageSendPayload"
+                ],
+            },
+        },
+    },
+}
+
+
+async def parse_message_send(request: Request) -> MessageSendPayload:
+    try:
+        return _decode_message_send(await request.body())
+    except msgspec.DecodeError as e:  # ValidationError — підклас DecodeError
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 class MessagePayload(BaseModel):
     sender_id: str
     receiver_id: str
@@ -106,30 +254,43 @@ def register(data: RegisterPayload):
     """
     Реєстрація по ніку (username).
     """
-    user_id = str(uuid.uuid4())
+    # 128 випадкових біт у hex — та сама унікальність, що й uuid4,
+    # без UUID-обʼєкта і форматування з дефісами
+    user_id = os.urandom(16).hex()
 
-    ident = generate_identity()
+    ident = generate_identity_raw()
     prekeys = generate_onetime_prekeys(20)
 
-    USERS[user_id] = {
+    USERS[user_id] = user = {
         "username": data.username,                # 👈 зберігаємо нік
-        "identity_priv_b64": ident["identity_priv_b64"],
-        "identity_pub_b64": ident["identity_pub_b64"],
-        "signed_prekey_priv_b64": ident["signed_prekey_priv_b64"],
-        "signed_prekey_pub_b64": ident["signed_prekey_pub_b64"],
-        "signed_prekey_sig_b64": ident["signed_prekey_sig_b64"],
+        # ключі — сирі bytes, X3DH бере їх без base64
+        "identity_priv": ident["identity_priv"],
+        "identity_pub": ident["identity_pub"],
+        "signed_prekey_priv": ident["signed_prekey_priv"],
+        "signed_prekey_pub": ident["signed_prekey_pub"],
+        # base64 лише на межі API — публічна частина bundle, один раз тут
+        "identity_pub_b64": b64e(ident["identity_pub"]),
+        "signed_prekey_pub_b64": b64e(ident["signed_prekey_pub"]),
+        "signed_prekey_sig_b64": b64e(ident["signed_prekey_sig"]),
     }
 
-    PREKEYS[user_id] = prekeys
-    INBOX[user_id] = []
+    pubs = [pk["pub_b64"] for pk in prekeys]
+    slot = USER_SLOT[user_id] = next(_NEXT_SLOT)
+    PREKEYS[user_id] = {
+        "pubs": pubs,
+        "privs": {pk["pub_b64"]: pk["priv_b64"] for pk in prekeys},
+    }
+    INBOX[user_id] = deque(maxlen=MAX_PENDING)
 
     return {
         "user_id": user_id,
         "username": data.username,                # 👈 віддаємо нік назад
-        "identity_pub": ident["identity_pub_b64"],
-        "signed_prekey_pub": ident["signed_prekey_pub_b64"],
-        "signed_prekey_sig": ident["signed_prekey_sig_b64"],
-        "onetime_prekeys": [pk["pub_b64"] for pk in prekeys],
+        "identity_pub": user["identity_pub_b64"],
+        "signed_prekey_pub": user["signed_prekey_pub_b64"],
+        "signed_prekey_sig": user["signed_prekey_sig_b64"],
+        "onetime_prekeys": pubs,
+        "cipher_suite": AEAD_SUITE,
+        "slot": slot,                             # 👈 адреса для бінарних call-кадрів
     }
 
 
@@ -139,15 +300,28 @@ def register(data: RegisterPayload):
 
 @app.get("/bundle/{user_id}")
 def get_bundle(user_id: str):
-    if user_id not in USERS:
+    user = USERS.get(user_id)
+    if user is None:
         return {"error": "invalid user"}
 
-    return {
-        "identity_pub": USERS[user_id]["identity_pub_b64"],
-        "signed_prekey_pub": USERS[user_id]["signed_prekey_pub_b64"],
-        "signed_prekey_sig": USERS[user_id]["signed_prekey_sig_b64"],
-        "onetime_prekeys": [pk["pub_b64"] for pk in PREKEYS.get(user_id, [])],
-    }
+    # готовий JSON bundle; prekey-ї лише зникають, тож їх кількість —
+    # версія кешу: після pop у session_init bundle збереться заново
+    pubs = PREKEYS[user_id]["pubs"]
+    cached = user.get("_bundle")
+    if cached is None or cached[0] != len(pubs):
+        cached = user["_bundle"] = (
+            len(pubs),
+            orjson.dumps(
+                {
+                    "identity_pub": user["identity_pub_b64"],
+                    "signed_prekey_pub": user["signed_prekey_pub_b64"],
+                    "signed_prekey_sig": user["signed_prekey_sig_b64"],
+                    "onetime_prekeys": pubs,
+                    "cipher_suite": AEAD_SUITE,
+                }
+            ),
+        )
+    return Response(content=cached[1], media_type="application/json")
 
 
 # ============================================================
@@ -159,37 +333,36 @@ def session_init(data: InitiateSessionPayload):
     s = data.sender_id
     r = data.receiver_id
 
-    if s not in USERS or r not in USERS:
+    sender = USERS.get(s)
+    receiver = USERS.get(r)
+    if sender is None or receiver is None:
         return {"error": "invalid sender/receiver"}
 
-    recv_bundle = {
-        "identity_pub_b64": USERS[r]["identity_pub_b64"],
-        "signed_prekey_pub_b64": USERS[r]["signed_prekey_pub_b64"],
-        "signed_prekey_sig_b64": USERS[r]["signed_prekey_sig_b64"],
-    }
-
     onetime = None
-    if PREKEYS.get(r):
-        pk = PREKEYS[r].pop(0)
-        onetime = pk["pub_b64"]
-
-    master_secret = x3dh_sender(
-        identity_priv_b64=USERS[s]["identity_priv_b64"],
-        eph_priv_b64=generate_ephemeral_key_b64(),
-        recv_bundle=recv_bundle,
-        onetime_prekey_pub_b64=onetime,
+    prekeys = PREKEYS[r]
+    if prekeys["pubs"]:
+        pub_b64 = prekeys["pubs"].pop()
+        prekeys["privs"].pop(pub_b64, None)
+        onetime = b64d(pub_b64)
+
+    master_secret = x3dh_sender_raw(
+        identity_priv=sender["identity_priv"],
+        eph_priv=generate_ephemeral_key(),
+        identity_pub=receiver["identity_pub"],
+        signed_prekey_pub=receiver["signed_prekey_pub"],
+        onetime_prekey_pub=onetime,
     )
 
-    SESSIONS[(s, r)] = RatchetState(
-        root_key=master_secret,
-        chain_key_send=master_secret + b"A",
-        chain_key_recv=master_secret + b"B",
-    )
-    SESSIONS[(r, s)] = RatchetState(
-        root_key=master_secret,
-        chain_key_send=master_secret + b"B",
-        chain_key_recv=master_secret + b"A",
-    )
+    # v7: симетричний ratchet — обидва напрямки на одному root_key,
+    # тому nonce-префікси напрямків мусять відрізнятися
+    prefix_sr, prefix_rs = session_nonce_prefixes()
+    state_sr = RatchetState(root_key=master_secret, nonce_prefix=prefix_sr)
+    state_rs = RatchetState(root_key=master_secret, nonce_prefix=prefix_rs)
+    a, b = USER_SLOT[s], USER_SLOT[r]
+    if a <= b:
+        SESSIONS[(a << 32) | b] = SessionPair(state_sr, state_rs)
+    else:
+        SESSIONS[(b << 32) | a] = SessionPair(state_rs, state_sr)
 
     return {
         "status": "session_established",
@@ -201,15 +374,16 @@ def session_init(data: InitiateSessionPayload):
 #   ENCRYPT & SEND MESSAGE
 # ============================================================
 
-@app.post("/message/send")
-def message_send(data: MessageSendPayload):
-    key = (data.sender_id, data.receiver_id)
-    if key not in SESSIONS:
+@app.post("/message/send", openapi_extra=_MESSAGE_SEND_OPENAPI)
+def message_send(data: MessageSendPayload = Depends(parse_message_send)):
+    state = _session_state(data.sender_id, data.receiver_id)
+    if state is None:
         return {"error": "session not initialized"}
 
-    packet = ratchet_encrypt(SESSIONS[key], data.text)
+    # пакет не виходить за межі процесу — тримаємо сирі bytes, без base64
+    packet = ratchet_encrypt_raw(state, data.text.encode("utf-8"))
 
-    INBOX.setdefault(data.receiver_id, []).append(
+    INBOX[data.receiver_id].append(
         {
             "from": data.sender_id,
             "packet": packet,
@@ -223,34 +397,74 @@ def message_send(data: MessageSendPayload):
 #   POLL MESSAGES (DELIVER & DECRYPT ON SERVER)
 # ============================================================
 
+# окремий пул під розшифрування: OpenSSL AEAD відпускає GIL, тож батчі
+# різних юзерів ідуть паралельно і не займають загальний threadpool FastAPI
+_DECRYPT_POOL = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 1, thread_name_prefix="decrypt"
+)
+
+
 @app.get("/message/poll/{user_id}")
-def poll(user_id: str):
-    msgs = INBOX.get(user_id, [])
+async def poll(user_id: str):
+    return await asyncio.get_running_loop().run_in_executor(
+        _DECRYPT_POOL, _poll_sync, user_id
+    )
+
+
+def _poll_sync(user_id: str):
+    # забираємо чергу через popleft(): повідомлення, що прийшли під час
+    # poll, не губляться — вони лишаються на наступний раз
+    inbox = INBOX.get(user_id)
+    msgs: List[dict] = []
+    while inbox:
+        msgs.append(inbox.popleft())
     result: List[dict] = []
 
-    for item in msgs:
-        sender = item["from"]
-        packet = item["packet"]
+    # групуємо чергу по сесіях відправників: AEAD сесії дістається
+    # один раз на батч, а не на кожне повідомлення
+    by_sender: Dict[str, List[int]] = {}
+    for i, item in enumerate(msgs):
+        by_sender.setdefault(item["from"], []).append(i)
 
-        key = (sender, user_id)
-        if key not in SESSIONS:
+    texts: Dict[int, Tuple[str, str]] = {}
+    for sender, idxs in by_sender.items():
+        state = _session_state(sender, user_id)
+        if state is None:
             continue
 
-        plaintext, new_state = ratchet_decrypt(SESSIONS[key], packet)
-        SESSIONS[key] = new_state
-
         username = USERS.get(sender, {}).get("username", sender)
-
+        try:
+            plaintexts = ratchet_decrypt_batch_raw(
+                state, [msgs[i]["packet"] for i in idxs]
+            )
+        except InvalidTag:
+            # у батчі є пакет під старим ключем (напр. session/init
+            # перезапустили між send і poll) — розбираємо поштучно,
+            # такі пакети вже ніколи не розшифруються, тож їх пропускаємо;
+            # решта (і інші відправники) доходять як зазвичай
+            plaintexts = []
+            for i in idxs:
+                try:
+                    plaintexts.append(ratchet_decrypt_raw(state, msgs[i]["packet"]))
+                except InvalidTag:
+                    plaintexts.append(None)
+        for i, plaintext in zip(idxs, plaintexts):
+            if plaintext is not None:
+                texts[i] = (username, plaintext.decode("utf-8"))
+
+    # віддаємо в порядку надходження
+    for i, item in enumerate(msgs):
+        if i not in texts:
+            continue
+        username, plaintext = texts[i]
         result.append(
             {
-                "from": sender,
+                "from": item["from"],
                 "from_name": username,     # 👈 додаємо нік відправника
                 "text": plaintext,
             }
         )
 
-    INBOX[user_id] = []
-
     return {"messages": result}
 
 
@@ -260,12 +474,11 @@ def poll(user_id: str):
 
 @app.post("/message/receive")
 def receive_message(data: MessagePayload):
-    key = (data.sender_id, data.receiver_id)
-    if key not in SESSIONS:
+    state = _session_state(data.sender_id, data.receiver_id)
+    if state is None:
         return {"error": "session not initialized"}
 
-    plaintext, new_state = ratchet_decrypt(SESSIONS[key], data.ciphertext)
-    SESSIONS[key] = new_state
+    plaintext = ratchet_decrypt(state, data.ciphertext)
 
     return {"plaintext": plaintext}
 
@@ -276,20 +489,68 @@ def receive_message(data: MessagePayload):
 
 @app.websocket("/call/{user_id}")
 async def call_socket(ws: WebSocket, user_id: str):
+    """
+    Формати кадрів:
+      - бінарний: [to_slot: uint32 BE][payload] — relay без JSON-парсингу,
+        лише між юзерами зі спільною сесією; адресат отримує
+        [from_slot: uint32 BE][payload] бінарним кадром. Свій slot
+        клієнт бере з відповіді /register;
+      - бінарний JSON (починається з "{") — msgspec розбирає bytes напряму,
+        без UTF-8 decode у str; пересилаємо ті самі bytes. Slot-и
+        < 0x7B000000, тож з "{" заголовок slot-а не збігається;
+      - текстовий JSON з полем "to" (як шлють фронтенди) — пересилаємо як є.
+    """
     await ws.accept()
     CALL_CONNECTIONS[user_id] = ws
+    slot = USER_SLOT.get(user_id)
+    if slot is not None:
+        CALL_SLOTS[slot] = ws
+        from_hdr = slot.to_bytes(4, "big")  # адресат бачить, хто шле
+
+    # словники не перепризначаються (wipe робить clear()), тож
+    # bound-метод можна взяти один раз на зʼєднання
+    conn_get = CALL_CONNECTIONS.get
+    slot_get = CALL_SLOTS.get
 
     try:
         while True:
-            raw = await ws.receive_text()
-            msg = json.loads(raw)
-            target = msg.get("to")
-
-            if target in CALL_CONNECTIONS:
-                await CALL_CONNECTIONS[target].send_text(raw)
+            frame = await ws.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+
+            data = frame.get("bytes")
+            if data is not None:
+                if data[:1] == b"{":
+                    target_ws = conn_get(_decode_signal_target(data))
+                    if target_ws is not None:
+                        await target_ws.send_bytes(data)
+                    continue
+
+                # 🛡 slot-и послідовні й легко вгадуються, тож без спільної
+                # сесії (і без повного заголовка) кадр просто відкидаємо
+                if slot is None or len(data) < 4:
+                    continue
+                to_slot = int.from_bytes(data[:4], "big")
+                lo, hi = (slot, to_slot) if slot <= to_slot else (to_slot, slot)
+                if ((lo << 32) | hi) not in SESSIONS:
+                    continue
+
+                target_ws = slot_get(to_slot)
+                if target_ws is not None:
+                    await target_ws.send_bytes(from_hdr + data[4:])
+                continue
+
+            raw = frame["text"]
+            target = _signal_target(raw)
+
+            target_ws = conn_get(target)
+            if target_ws is not None:
+                await target_ws.send_text(raw)
 
     except WebSocketDisconnect:
         CALL_CONNECTIONS.pop(user_id, None)
+        if slot is not None:
+            CALL_SLOTS.pop(slot, None)
 
 
 # ============================================================
@@ -298,14 +559,18 @@ async def call_socket(ws: WebSocket, user_id: str):
 
 @app.post("/zerotrace/wipe")
 def wipe(data: WipePayload):
-    if data.admin_secret != ZERO_TRACE_SECRET:
+    digest = hashlib.sha256(data.admin_secret.encode("utf-8")).digest()
+    if not hmac.compare_digest(digest, _WIPE_DIGEST):
         return {"error": "invalid"}
 
     USERS.clear()
+    USER_SLOT.clear()
     PREKEYS.clear()
     SESSIONS.clear()
     INBOX.clear()
     CALL_CONNECTIONS.clear()
+    CALL_SLOTS.clear()
+    clear_key_cache()
 
     return {"status": "wiped"}
 
@@ -315,4 +580,6 @@ def wipe(data: WipePayload):
 # ============================================================
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop + httptools (обидва йдуть з uvicorn[standard]); один воркер —
+    # стан у RAM цього процесу, кілька воркерів його б розділили
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
\ No newline at end of file